@@ -1,10 +1,76 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import json
+import pyarrow as pa
 import altair as alt
+from numba import njit, prange
 from data_loader import load_data_from_s3
 
+# =============================================================================
+# Numba Kernels
+# =============================================================================
+@njit(parallel=True, cache=True, nogil=True)
+def _count_top_level_keys(buf, offsets):
+    """
+    Counts the top-level keys of each dict-like string packed into `buf`.
+    Row i spans buf[offsets[i]:offsets[i + 1]]; a key is a ':' at brace depth 1
+    outside of quotes, so nested structures are handled without building dicts.
+    """
+    n = len(offsets) - 1
+    counts = np.zeros(n, dtype=np.int32)
+    for i in prange(n):
+        depth = 0
+        quote = 0
+        count = 0
+        for j in range(offsets[i], offsets[i + 1]):
+            c = buf[j]
+            if quote != 0:
+                if c == quote:
+                    quote = 0
+            elif c == 39 or c == 34:  # ' or "
+                quote = c
+            elif c == 123 or c == 91:  # { or [
+                depth += 1
+            elif c == 125 or c == 93:  # } or ]
+                depth -= 1
+            elif c == 58 and depth == 1:  # :
+                count += 1
+        counts[i] = count
+    return counts
+
+@njit(cache=True, nogil=True)
+def _aggregate_champions(labels, n_groups, scores, messages, weeks, n_weeks):
+    """
+    Per-user aggregation in a single pass over the rows, in any order.
+    Score mean and variance use Welford's update; distinct weeks are counted with a
+    per-user seen-flag for each week code, and week codes are in time order (-1 is NaT).
+    """
+    first_row = np.zeros(n_groups, dtype=np.int64)
+    count = np.zeros(n_groups, dtype=np.int64)
+    mean = np.zeros(n_groups)
+    m2 = np.zeros(n_groups)
+    total_messages = np.zeros(n_groups)
+    last_week = np.full(n_groups, -1, dtype=np.int64)
+    active_weeks = np.zeros(n_groups, dtype=np.int64)
+    seen = np.zeros((n_groups, max(n_weeks, 1)), dtype=np.bool_)
+    for i in range(len(labels)):
+        g = labels[i]
+        if count[g] == 0:
+            first_row[g] = i
+        count[g] += 1
+        delta = scores[i] - mean[g]
+        mean[g] += delta / count[g]
+        m2[g] += delta * (scores[i] - mean[g])
+        total_messages[g] += messages[i]
+        w = weeks[i]
+        if w >= 0 and not seen[g, w]:
+            seen[g, w] = True
+            active_weeks[g] += 1
+            if w > last_week[g]:
+                last_week[g] = w
+    return first_row, count, mean, m2, total_messages, last_week, active_weeks
+
+
 # =============================================================================
 # Main App Function
 # =============================================================================
@@ -28,6 +94,13 @@ def create_champions_dashboard(df):
         tools_weight = st.slider("Tool Usage (%)", 0, 100, 10, 5)
 
         total_weight = messages_weight + models_weight + gpts_weight + projects_weight + tools_weight
+        st.session_state['weights'] = {
+            'messages': messages_weight,
+            'models': models_weight,
+            'gpts': gpts_weight,
+            'projects': projects_weight,
+            'tools': tools_weight
+        }
         if total_weight != 100:
             st.error(f"Weights must sum to 100%. Current sum: {total_weight}%")
         else:
@@ -45,105 +118,174 @@ def create_champions_dashboard(df):
 
     # --- Data Processing ---
     # Use a caching mechanism to avoid reprocessing data on every interaction.
+    # Cleaning, parsing and normalization don't depend on the weights, so they are cached
+    # separately from the weighting step; moving a slider only re-runs the cheap dot product.
     @st.cache_data
-    def process_data(df_raw, weights):
-        df_processed = df_raw.copy()
+    def clean_raw(df_raw):
+        df_clean = df_raw.copy()
 
         # Convert relevant columns to numeric, coercing errors
         numeric_cols = ['messages', 'gpts_messaged', 'projects_created']
         for col in numeric_cols:
-            df_processed[col] = pd.to_numeric(df_processed[col], errors='coerce')
+            df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
 
         # Fill NaNs in key columns to avoid errors during calculations
-        df_processed[numeric_cols] = df_processed[numeric_cols].fillna(0)
-        df_processed['model_to_messages'] = df_processed['model_to_messages'].fillna('{}')
+        # These are counts, so 32-bit integers halve their memory footprint
+        df_clean[numeric_cols] = df_clean[numeric_cols].fillna(0).astype('int32')
+        df_clean['model_to_messages'] = df_clean['model_to_messages'].fillna('{}')
         
         # Gracefully handle the absence of the 'tool_to_messages' column
-        if 'tool_to_messages' not in df_processed.columns:
-            df_processed['tool_to_messages'] = '{}'
+        if 'tool_to_messages' not in df_clean.columns:
+            df_clean['tool_to_messages'] = '{}'
         else:
-            df_processed['tool_to_messages'] = df_processed['tool_to_messages'].fillna('{}')
+            df_clean['tool_to_messages'] = df_clean['tool_to_messages'].fillna('{}')
+
+        df_clean['name'] = df_clean['name'].fillna('Unknown User')
+        df_clean['email'] = df_clean['email'].fillna('Unknown Email')
+        df_clean['company'] = df_clean['company'].fillna('N/A').astype(str)
+        if 'pbu' in df_clean.columns:
+            df_clean['pbu'] = df_clean['pbu'].fillna('N/A').astype(str)
 
-        df_processed['name'] = df_processed['name'].fillna('Unknown User')
-        df_processed['email'] = df_processed['email'].fillna('Unknown Email')
-        df_processed['company'] = df_processed['company'].fillna('N/A').astype(str)
-        if 'pbu' in df_processed.columns:
-            df_processed['pbu'] = df_processed['pbu'].fillna('N/A').astype(str)
+        # Store the user keys as categoricals so grouping and filtering work on integer codes
+        category_cols = [col for col in ['name', 'email', 'company', 'pbu'] if col in df_clean.columns]
+        df_clean[category_cols] = df_clean[category_cols].astype('category')
         
         # Ensure period_end is a datetime object for proper sorting
-        df_processed['period_end'] = pd.to_datetime(df_processed['period_end'])
+        df_clean['period_end'] = pd.to_datetime(df_clean['period_end'])
+
+        return df_clean
+
+    @st.cache_data
+    def compute_norms(df_clean):
+        # Only the derived columns are built here, in a thin frame sharing df_clean's index;
+        # they are joined back onto the cleaned data where needed instead of copying it
+        df_norms = pd.DataFrame(index=df_clean.index)
 
         # --- Feature Engineering: Calculate components of the Champion Score ---
-        def safe_json_loads(s):
-            try:
-                # The data uses single quotes, which is not valid JSON. Replace them.
-                return json.loads(s.replace("'", "\""))
-            except (json.JSONDecodeError, AttributeError):
-                return {}
+        def count_keys(s):
+            # The kernel takes one contiguous byte buffer plus row offsets into it
+            if isinstance(s.dtype, pd.ArrowDtype) or (isinstance(s.dtype, pd.StringDtype) and s.dtype.storage != 'python'):
+                # Arrow-backed strings are already laid out that way, so read their buffers zero-copy
+                arr = pa.array(s.array)
+                if isinstance(arr, pa.ChunkedArray):
+                    arr = arr.combine_chunks()
+                if not (pa.types.is_string(arr.type) or pa.types.is_large_string(arr.type)):
+                    arr = arr.cast(pa.large_string())
+                _, offsets_buf, data_buf = arr.buffers()
+                offset_type = np.int64 if pa.types.is_large_string(arr.type) else np.int32
+                offsets = np.frombuffer(offsets_buf, dtype=offset_type)[arr.offset:arr.offset + len(arr) + 1]
+                buf = np.frombuffer(data_buf, dtype=np.uint8) if data_buf is not None else np.zeros(0, dtype=np.uint8)
+            else:
+                # Object columns have to be packed in Python
+                encoded = [x.encode() if isinstance(x, str) else b'' for x in s]
+                offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+                offsets[1:] = np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)))
+                buf = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+            return _count_top_level_keys(buf, offsets)
 
         # Calculate model and tool diversity for each row (each week)
-        df_processed['num_models_used'] = df_processed['model_to_messages'].apply(lambda x: len(safe_json_loads(x)))
-        df_processed['num_tools_used'] = df_processed['tool_to_messages'].apply(lambda x: len(safe_json_loads(x)))
+        df_norms['num_models_used'] = count_keys(df_clean['model_to_messages'])
+        df_norms['num_tools_used'] = count_keys(df_clean['tool_to_messages'])
 
         # Normalize metrics on a scale of 0 to 1 to make them comparable
-        # Normalization is done on the entire column
-        df_processed['msg_norm'] = (df_processed['messages'] - df_processed['messages'].min()) / (df_processed['messages'].max() - df_processed['messages'].min())
-        df_processed['model_norm'] = (df_processed['num_models_used'] - df_processed['num_models_used'].min()) / (df_processed['num_models_used'].max() - df_processed['num_models_used'].min())
-        df_processed['gpts_norm'] = (df_processed['gpts_messaged'] - df_processed['gpts_messaged'].min()) / (df_processed['gpts_messaged'].max() - df_processed['gpts_messaged'].min())
-        df_processed['projects_norm'] = (df_processed['projects_created'] - df_processed['projects_created'].min()) / (df_processed['projects_created'].max() - df_processed['projects_created'].min())
-        df_processed['tool_norm'] = (df_processed['num_tools_used'] - df_processed['num_tools_used'].min()) / (df_processed['num_tools_used'].max() - df_processed['num_tools_used'].min())
-        
-        # Handle cases where max and min are the same (results in NaN)
+        # Normalization is done on the entire column, all five at once in a single NumPy pass
         norm_cols = ['msg_norm', 'model_norm', 'gpts_norm', 'projects_norm', 'tool_norm']
-        df_processed[norm_cols] = df_processed[norm_cols].fillna(0)
+        metrics = np.stack([
+            df_clean['messages'],
+            df_norms['num_models_used'],
+            df_clean['gpts_messaged'],
+            df_clean['projects_created'],
+            df_norms['num_tools_used']
+        ], axis=1, dtype=np.float32)
+        col_min = metrics.min(axis=0)
+        col_max = metrics.max(axis=0)
+
+        # Guard against columns where max and min are the same, which would divide by zero
+        col_range = np.where(col_max > col_min, col_max - col_min, 1.0)
+        norm_matrix = (metrics - col_min) / col_range
+        df_norms[norm_cols] = norm_matrix
+
+        return df_norms, norm_matrix
 
+    @st.cache_data
+    def apply_weights(norm_matrix, weights):
         # --- Calculate the Weekly Champion Score ---
-        df_processed['champion_score'] = (
-            df_processed['msg_norm'] * (weights['messages'] / 100) +
-            df_processed['model_norm'] * (weights['models'] / 100) +
-            df_processed['gpts_norm'] * (weights['gpts'] / 100) +
-            df_processed['projects_norm'] * (weights['projects'] / 100) +
-            df_processed['tool_norm'] * (weights['tools'] / 100)
-        ) * 100 # Scale to 100 for better readability
+        # A single matrix-vector product over the normalized metrics, in the same column order
+        weight_vector = np.array([
+            weights['messages'],
+            weights['models'],
+            weights['gpts'],
+            weights['projects'],
+            weights['tools']
+        ], dtype=np.float32) / 100
+        return (norm_matrix @ weight_vector) * 100 # Scale to 100 for better readability
 
-        return df_processed
+    @st.cache_data
+    def build_name_index(df_clean):
+        # Map each user to their row positions so the deep dive doesn't scan the whole frame
+        return {
+            name: np.asarray(rows, dtype=np.int32)
+            for name, rows in df_clean.groupby('name', observed=True).indices.items()
+        }
 
     # --- Aggregate Data for All-Time Analysis ---
     @st.cache_data
-    def get_all_time_champions(df_processed):
+    def get_all_time_champions(df_clean, champion_scores):
         # Filter out users with no activity to clean up the list
-        active_users_df = df_processed[df_processed['messages'] > 0]
+        is_active = (df_clean['messages'] > 0).to_numpy()
+        active_users_df = df_clean[is_active]
+
+        # Build one integer label per user from the categorical codes of the key columns.
+        # Re-factorizing after each column keeps the combined key small and preserves sort order.
+        user_cols = ['name', 'email', 'company']
+        labels = np.zeros(len(active_users_df), dtype=np.int64)
+        for col in user_cols:
+            key_col = active_users_df[col].cat
+            labels, _ = pd.factorize(labels * len(key_col.categories) + key_col.codes.to_numpy(), sort=True)
+        n_users = labels.max() + 1 if len(labels) else 0
+        weeks, week_values = pd.factorize(active_users_df['period_end'], sort=True)
+
+        # Calculate all-time stats in a single jitted pass, without sorting the rows
+        first_row, count, mean, m2, total_messages, last_week, active_weeks = _aggregate_champions(
+            labels,
+            n_users,
+            champion_scores[is_active].astype(np.float64),
+            active_users_df['messages'].to_numpy(dtype=np.float64),
+            weeks,
+            len(week_values)
+        )
 
-        # Group by user to calculate all-time stats
-        agg_champions = active_users_df.groupby(['name', 'email', 'company']).agg(
-            avg_champion_score=('champion_score', 'mean'),
-            score_stability=('champion_score', 'std'),
-            total_messages=('messages', 'sum'),
-            active_weeks=('period_end', 'nunique'),
-            last_active=('period_end', 'max')
-        ).reset_index()
+        agg_champions = active_users_df[user_cols].iloc[first_row].reset_index(drop=True)
+        agg_champions['avg_champion_score'] = mean
+        agg_champions['score_stability'] = np.sqrt(np.divide(m2, count - 1, out=np.full(n_users, np.nan), where=count > 1))
+        agg_champions['total_messages'] = total_messages
+        agg_champions['active_weeks'] = active_weeks
+        agg_champions['last_active'] = week_values.take(last_week, allow_fill=True)
 
         # Fill NaN in stability for users with only one active week (std is NaN)
         agg_champions['score_stability'] = agg_champions['score_stability'].fillna(0)
         
         # Sort to find the top champions
         agg_champions = agg_champions.sort_values(by='avg_champion_score', ascending=False)
-        agg_champions['rank'] = agg_champions['avg_champion_score'].rank(method='dense', ascending=False).astype(int)
+
+        # Rows are already in descending score order, so the dense rank just steps up at each new score
+        scores = agg_champions['avg_champion_score'].to_numpy()
+        agg_champions['rank'] = np.cumsum(np.diff(scores, prepend=np.nan) != 0).astype(np.int32)
 
         return agg_champions
 
+    # Cleaning depends only on the loaded data, so it runs once rather than per weight change
+    df_clean = clean_raw(df)
+    name_index = build_name_index(df_clean)
+
     # --- UI Rendering ---
-    # Only proceed if weights are valid
-    if total_weight == 100:
-        weights = {
-            'messages': messages_weight,
-            'models': models_weight,
-            'gpts': gpts_weight,
-            'projects': projects_weight,
-            'tools': tools_weight
-        }
-        df_processed = process_data(df, weights)
-        df_champions = get_all_time_champions(df_processed)
+    # The dashboard is a fragment: its own widgets (leaderboard size, user selection, data explorer)
+    # rerun only this block, while the sidebar weights are read back from session state.
+    @st.fragment
+    def scorecard_fragment(df_clean, df_norms, norm_matrix):
+        weights = st.session_state['weights']
+        champion_scores = apply_weights(norm_matrix, weights)
+        df_champions = get_all_time_champions(df_clean, champion_scores)
 
         # --- Main Dashboard View ---
         st.header("Leaderboard: All-Time Champions")
@@ -184,7 +326,11 @@ def create_champions_dashboard(df):
 
         if selected_user_name:
             # Filter data for the selected user
-            user_data = df_processed[df_processed['name'] == selected_user_name].sort_values(by='period_end')
+            user_rows = name_index[selected_user_name]
+            user_data = pd.DataFrame({
+                'period_end': df_clean['period_end'].to_numpy()[user_rows],
+                'champion_score': champion_scores[user_rows]
+            }, index=df_clean.index[user_rows]).sort_values(by='period_end')
             user_champion_stats = df_champions[df_champions['name'] == selected_user_name].iloc[0]
 
             st.subheader(f"Activity for {selected_user_name}")
@@ -199,27 +345,48 @@ def create_champions_dashboard(df):
             # --- Chart: Champion Score Over Time ---
             st.markdown("#### Weekly Champion Score Trend")
             
-            # Create a chart-friendly dataframe for Altair
-            chart_data = user_data[['period_end', 'champion_score']].reset_index()
+            # Create a compact chart-friendly dataframe for Altair: epoch millis and float32 scores
+            chart_points = user_data.dropna(subset=['period_end'])
+            chart_data = pd.DataFrame({
+                'period_end': chart_points['period_end'].to_numpy(dtype='datetime64[ms]').astype(np.int64),
+                'champion_score': chart_points['champion_score'].to_numpy(dtype=np.float32)
+            })
 
             # Check if there is data to plot
             if not chart_data.empty:
                 # Use Altair for more control over the chart
                 chart = alt.Chart(chart_data).mark_line(point=True).encode(
-                    x=alt.X('period_end:T', title='Week', axis=alt.Axis(format="%Y-%m-%d")),
+                    x=alt.X('period_end:T', title='Week', axis=alt.Axis(format="%Y-%m-%d"), scale=alt.Scale(type='utc')),
                     y=alt.Y('champion_score:Q', title='Weekly Champion Score'),
-                    tooltip=['period_end', 'champion_score']
+                    tooltip=[
+                        alt.Tooltip('period_end:T', format="%Y-%m-%d", formatType='utc'),
+                        alt.Tooltip('champion_score:Q', format='.1f')
+                    ]
                 ).interactive()
                 st.altair_chart(chart, use_container_width=True)
             else:
                 st.warning("No weekly score data available to display for this user.")
 
         # --- Data Explorer ---
+        # Full tables are serialized to the browser on every rerun, so only a preview is shown on request
         with st.expander("View Raw and Processed Data"):
+            preview_rows = 500
             st.subheader("Processed Data with Champion Scores")
-            st.dataframe(df_processed)
+            if st.checkbox("Show processed data (slow)"):
+                st.caption(f"Showing the first {preview_rows:,} of {len(df_clean):,} rows.")
+                # Join the derived columns onto the cleaned data only for the previewed rows
+                df_preview = df_clean.head(preview_rows).join(df_norms.head(preview_rows))
+                df_preview['champion_score'] = champion_scores[:preview_rows]
+                st.dataframe(df_preview)
             st.subheader("Original Uploaded Data")
-            st.dataframe(df)
+            if st.checkbox("Show original data (slow)"):
+                st.caption(f"Showing the first {preview_rows:,} of {len(df):,} rows.")
+                st.dataframe(df.head(preview_rows))
+
+    # Only proceed if weights are valid
+    if total_weight == 100:
+        df_norms, norm_matrix = compute_norms(df_clean)
+        scorecard_fragment(df_clean, df_norms, norm_matrix)
     else:
         st.error("Please adjust the weights in the sidebar until they sum to 100% to view the dashboard.")
 
@@ -16,6 +16,12 @@ def _configure_duckdb_s3_access(con):
     con.execute(f"SET s3_secret_access_key='{s3_secret_key}';")
     return con
 
+@st.cache_resource
+def _get_duckdb_connection():
+    """Creates the S3-configured DuckDB connection once and shares it across reruns and sessions."""
+    con = duckdb.connect(database=':memory:')
+    return _configure_duckdb_s3_access(con)
+
 def expand_model_usage(df):
     """
     Takes a merged dataframe and expands the 'model_to_messages' column
@@ -60,14 +66,14 @@ def expand_model_usage(df):
 
     return final_df
 
-@st.cache_data
+@st.cache_data(ttl=3600)
 def load_data_from_s3(report_type):
     """
     Main data pipeline function. Connects to S3, loads raw data,
     processes it, and performs the final join.
     """
-    con = duckdb.connect(database=':memory:')
-    con = _configure_duckdb_s3_access(con)
+    # DuckDB connections aren't thread-safe, so each load works on its own cursor of the shared connection
+    con = _get_duckdb_connection().cursor()
     
     bucket_name = st.secrets["aws"]["s3_bucket_name"]
     s3_folder = "weekly" if report_type == "Weekly" else "monthly"
@@ -134,7 +140,9 @@ def load_data_from_s3(report_type):
     FULL OUTER JOIN usage_table AS u
         ON e.email_address = u.email;
     """
-    merged_df = con.execute(final_join_query).fetchdf()
+    # Hand the result over as Arrow-backed columns: strings stay in Arrow memory instead of
+    # becoming Python objects, and numeric/date columns keep their native types
+    merged_df = con.execute(final_join_query).to_arrow_table().to_pandas(types_mapper=pd.ArrowDtype)
 
 
    